@@ -5,13 +5,13 @@
 # License: MIT
 
 from collections.abc import Mapping
-from numbers import Real
+from contextlib import contextmanager
+from numbers import Integral, Real
 
 import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
 from scipy import sparse
-from sklearn.utils import check_array, check_random_state
-from sklearn.utils import _safe_indexing
-from sklearn.utils.sparsefuncs import mean_variance_axis
+from sklearn.utils import check_array, check_random_state, gen_batches
 
 from .base import BaseOverSampler
 from ..utils import check_target_type
@@ -19,6 +19,303 @@ from ..utils import Substitution
 from ..utils._docstring import _random_state_docstring
 from ..utils._validation import _deprecate_positional_args
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# number of samples drawn and gathered at once during the bootstrap
+_BATCH_SIZE = 1 << 16
+# number of elements of the blocks processed by the NumPy smoothed bootstrap
+_BLOCK_N_ELEMENTS = 1 << 15
+
+
+def _get_seed_sequence(random_state):
+    """Create a :class:`numpy.random.SeedSequence` from a `random_state`."""
+    if isinstance(random_state, Integral):
+        return np.random.SeedSequence(random_state)
+    random_state = check_random_state(random_state)
+    return np.random.SeedSequence(random_state.randint(np.iinfo(np.int32).max))
+
+
+def _smoothed_bootstrap_numpy(X_new, X, bootstrap_indices, scale):
+    """Scale in place the noise `X_new` and add the bootstrapped samples."""
+    # process blocks of rows fitting in cache such that the scaling and the
+    # addition read from cache instead of making two passes over memory
+    block_size = max(1, _BLOCK_N_ELEMENTS // max(1, X_new.shape[1]))
+    for block in gen_batches(X_new.shape[0], block_size):
+        X_block = X_new[block]
+        np.multiply(X_block, scale, out=X_block)
+        X_bootstrap = X[bootstrap_indices[block], :]
+        if sparse.issparse(X_bootstrap):
+            X_bootstrap = X_bootstrap.toarray()
+        np.add(X_block, X_bootstrap, out=X_block)
+
+
+if numba is not None:
+    # only allow contraction into FMA: the other fast-math flags would break
+    # the propagation of NaN and infinite values
+    @numba.njit(parallel=True, fastmath={"contract"}, cache=True)
+    def _smoothed_bootstrap_numba(X_new, X, bootstrap_indices, scale):
+        """Scale in place the noise `X_new` and add the bootstrapped samples."""
+        for i in numba.prange(X_new.shape[0]):
+            row = bootstrap_indices[i]
+            for j in range(X_new.shape[1]):
+                X_new[i, j] = X_new[i, j] * scale[j] + X[row, j]
+
+    @numba.njit(parallel=True, cache=True)
+    def _class_variance_numba(
+        X, target_indices, class_starts, class_counts, class_variance
+    ):
+        """Compute in place the per-class variance with Welford's algorithm."""
+        # the rows are read contiguously and the running statistics of blocks
+        # of features are updated in parallel
+        block_size = 256
+        n_features = X.shape[1]
+        for b in numba.prange((n_features + block_size - 1) // block_size):
+            start = b * block_size
+            stop = min(start + block_size, n_features)
+            mean = np.empty(stop - start)
+            m2 = np.empty(stop - start)
+            for c in range(class_starts.shape[0]):
+                mean[:] = 0.0
+                m2[:] = 0.0
+                for k in range(class_counts[c]):
+                    row = target_indices[class_starts[c] + k]
+                    inv_count = 1.0 / (k + 1)
+                    for j in range(start, stop):
+                        x = X[row, j]
+                        delta = x - mean[j - start]
+                        mean[j - start] += delta * inv_count
+                        m2[j - start] += delta * (x - mean[j - start])
+                for j in range(start, stop):
+                    class_variance[c, j] = m2[j - start] / class_counts[c]
+
+
+def _use_numba(X):
+    """Check whether the numba kernels can be used to process `X`.
+
+    The kernels are only used for dense arrays in native byte order with a
+    dtype supported by numba, i.e. boolean, integer, float32 or float64.
+    """
+    return (
+        numba is not None
+        and not sparse.issparse(X)
+        and X.dtype.isnative
+        and (X.dtype.kind in "biu" or X.dtype in (np.float32, np.float64))
+    )
+
+
+@contextmanager
+def _numba_num_threads(n_jobs):
+    """Limit the number of threads used by the numba kernels to `n_jobs`."""
+    if numba is None:
+        yield
+        return
+    num_threads = numba.get_num_threads()
+    numba.set_num_threads(
+        min(effective_n_jobs(n_jobs), numba.config.NUMBA_NUM_THREADS)
+    )
+    try:
+        yield
+    finally:
+        numba.set_num_threads(num_threads)
+
+
+def _smoothed_bootstrap(X_new, X, bootstrap_indices, scale):
+    """Generate in place a smoothed bootstrap from the Gaussian noise `X_new`.
+
+    The JIT-compiled kernel fusing the scaling, gathering and addition is
+    used for dense arrays when numba is installed and supports the dtype of
+    `X`.
+    """
+    if _use_numba(X):
+        _smoothed_bootstrap_numba(X_new, X, bootstrap_indices, scale)
+    else:
+        _smoothed_bootstrap_numpy(X_new, X, bootstrap_indices, scale)
+
+
+def _class_variance(X, class_indices):
+    """Compute the feature-wise variance of the samples of some classes.
+
+    For dense arrays, the variance is computed with Welford's online
+    algorithm in a single pass over the samples when numba is installed and
+    supports the dtype of `X`.
+    Otherwise, the samples of the requested classes are gathered once,
+    grouped by class, and the statistics of all classes are computed with
+    streaming passes over each contiguous group instead of fancy indexing `X`
+    once per class. For sparse matrices, the statistics of all
+    classes are obtained with a product between `X` and the one-hot encoding
+    of the target.
+
+    Parameters
+    ----------
+    X : {ndarray, sparse matrix} of shape (n_samples, n_features)
+        The input samples. Sparse matrices are expected in CSR format.
+
+    class_indices : dict
+        A dictionary mapping each class for which the variance is computed to
+        the indices of its samples.
+
+    Returns
+    -------
+    class_variance : dict
+        A dictionary mapping each class to the feature-wise variance of its
+        samples, of shape (n_features,).
+    """
+    if not class_indices:
+        return {}
+    classes = list(class_indices)
+    target_indices = np.concatenate(list(class_indices.values()))
+    class_counts = np.array([indices.size for indices in class_indices.values()])
+    class_starts = np.cumsum(class_counts) - class_counts
+    dtype = np.result_type(X.dtype, np.float64)
+
+    if sparse.issparse(X):
+        X = X.astype(dtype, copy=False)
+        if not X.has_canonical_format:
+            # each stored entry is centered: duplicated entries are summed
+            X = X.copy()
+            X.sum_duplicates()
+        sample_class = np.full(X.shape[0], -1, dtype=np.intp)
+        sample_class[target_indices] = np.repeat(
+            np.arange(len(classes)), class_counts
+        )
+        class_encoding = sparse.csr_matrix(
+            (
+                np.ones(target_indices.size, dtype=dtype),
+                (target_indices, sample_class[target_indices]),
+            ),
+            shape=(X.shape[0], len(classes)),
+        )
+        X_mean = (class_encoding.T @ X).toarray()
+        X_mean /= class_counts[:, np.newaxis]
+        # center the stored entries before squaring them: this is numerically
+        # stable contrary to computing E[X^2] - E[X]^2. The samples of the
+        # other classes are not selected by the one-hot encoding.
+        entry_class = sample_class[
+            np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+        ]
+        X_centered = X.copy()
+        X_centered.data -= X_mean[np.maximum(entry_class, 0), X.indices]
+        np.square(X_centered.data, out=X_centered.data)
+        class_variance = (class_encoding.T @ X_centered).toarray()
+        # the implicit zeros deviate from the mean by the mean itself; the
+        # stored zeros are already accounted for by the centered entries
+        X_centered.data = np.ones_like(X_centered.data)
+        class_nnz = (class_encoding.T @ X_centered).toarray()
+        class_variance += (class_counts[:, np.newaxis] - class_nnz) * X_mean**2
+        class_variance /= class_counts[:, np.newaxis]
+    elif _use_numba(X):
+        # single streaming pass over the samples without gathering them
+        class_variance = np.empty((len(classes), X.shape[1]), dtype=dtype)
+        _class_variance_numba(
+            X, target_indices, class_starts, class_counts, class_variance
+        )
+    else:
+        X_sorted = X[target_indices].astype(dtype, copy=False)
+        class_variance = np.empty((len(classes), X.shape[1]), dtype=dtype)
+        for X_class, variance in zip(
+            np.split(X_sorted, class_starts[1:]), class_variance
+        ):
+            # center in place each contiguous class and reduce the squared
+            # deviations: this is numerically stable contrary to computing
+            # E[X^2] - E[X]^2
+            X_class -= X_class.mean(axis=0)
+            np.square(X_class, out=X_class)
+            np.mean(X_class, axis=0, out=variance)
+
+    return dict(zip(classes, class_variance))
+
+
+def _generate_bootstrap(X, target_class_indices, scale, rng, X_out, sample_indices_out):
+    """Generate the bootstrap of a single class.
+
+    The samples are drawn with replacement from `target_class_indices`. When
+    `scale` is not None, a smoothed bootstrap is generated by adding a
+    Gaussian perturbation scaled feature-wise by `scale`.
+
+    The dense samples and the selected indices are written in place in
+    `X_out` and `sample_indices_out`, respectively. When `X` is sparse,
+    `X_out` is not used and the CSR blocks of the bootstrap are returned
+    instead.
+    """
+    n_samples, n_features = sample_indices_out.shape[0], X.shape[1]
+    if sparse.issparse(X) and scale is not None:
+        # the features with a null scale are not perturbed and keep the
+        # sparsity of the drawn samples: the non-zero entries are only known
+        # by scanning the smoothed bootstrap
+        is_dense_bootstrap = np.all(scale != 0)
+    X_blocks = []
+    # process the bootstrap by batch to keep the indices and the gathered rows
+    # in cache
+    for batch in gen_batches(n_samples, _BATCH_SIZE):
+        batch_indices = target_class_indices[
+            rng.integers(
+                target_class_indices.size,
+                size=batch.stop - batch.start,
+                dtype=np.intp,
+            )
+        ]
+        sample_indices_out[batch] = batch_indices
+        if scale is not None:
+            # the noise is drawn in the floating dtype of `scale` and directly
+            # in the output for dense arrays
+            if sparse.issparse(X):
+                X_new = rng.standard_normal(
+                    (batch.stop - batch.start, n_features), dtype=scale.dtype
+                )
+            else:
+                X_new = X_out[batch]
+                rng.standard_normal(dtype=scale.dtype, out=X_new)
+            _smoothed_bootstrap(X_new, X, batch_indices, scale)
+            if sparse.issparse(X):
+                if is_dense_bootstrap:
+                    X_blocks.append(_dense_to_csr(X_new, dtype=X.dtype))
+                else:
+                    X_blocks.append(sparse.csr_matrix(X_new, dtype=X.dtype))
+        elif sparse.issparse(X):
+            X_blocks.append(X[batch_indices])
+        else:
+            # the indices are always in range: `mode="clip"` avoids the
+            # buffering of `out` done by `mode="raise"`
+            np.take(X, batch_indices, axis=0, out=X_out[batch], mode="clip")
+    return X_blocks
+
+
+def _dense_to_csr(X, dtype):
+    """Wrap a dense array into a CSR matrix storing all its entries.
+
+    When all the features are perturbed, the smoothed bootstrap is dense, so
+    the structure of the matrix is known and the scan for the non-zero
+    entries done by `csr_matrix` is avoided.
+    """
+    n_samples, n_features = X.shape
+    indptr = np.arange(0, (n_samples + 1) * n_features, n_features, dtype=np.intp)
+    indices = np.tile(np.arange(n_features, dtype=np.intp), n_samples)
+    data = X.astype(dtype, copy=False).ravel()
+    return sparse.csr_matrix((data, indices, indptr), shape=(n_samples, n_features))
+
+
+def _stack_csr(blocks, n_features):
+    """Stack CSR matrices vertically by filling preallocated buffers."""
+    nnz = sum(block.nnz for block in blocks)
+    n_samples = sum(block.shape[0] for block in blocks)
+    dtype = np.result_type(*[block.dtype for block in blocks])
+    data = np.empty(nnz, dtype=dtype)
+    indices = np.empty(nnz, dtype=np.intp)
+    indptr = np.empty(n_samples + 1, dtype=np.intp)
+    indptr[0] = 0
+    row_start, nnz_start = 0, 0
+    for block in blocks:
+        row_stop = row_start + block.shape[0]
+        nnz_stop = nnz_start + block.nnz
+        data[nnz_start:nnz_stop] = block.data
+        indices[nnz_start:nnz_stop] = block.indices
+        indptr[row_start + 1 : row_stop + 1] = block.indptr[1:] + nnz_start
+        row_start, nnz_start = row_stop, nnz_stop
+    return sparse.csr_matrix((data, indices, indptr), shape=(n_samples, n_features))
+
 
 @Substitution(
     sampling_strategy=BaseOverSampler._sampling_strategy_docstring,
@@ -55,6 +352,17 @@ class RandomOverSampler(BaseOverSampler):
 
         .. versionadded:: 0.8
 
+    n_jobs : int, default=None
+        Number of CPU cores used to generate the bootstrap. The classes are
+        resampled in parallel, or, when the numba kernels generate a dense
+        smoothed bootstrap, the kernels use `n_jobs` threads.
+        ``None`` means 1 unless in a :obj:`joblib.parallel_backend` context.
+        ``-1`` means using all processors. See
+        `Glossary <https://scikit-learn.org/stable/glossary.html#term-n-jobs>`_
+        for more details.
+
+        .. versionadded:: 0.8
+
     Attributes
     ----------
     sample_indices_ : ndarray of shape (n_new_samples,)
@@ -130,10 +438,12 @@ RandomOverSampler # doctest: +NORMALIZE_WHITESPACE
         sampling_strategy="auto",
         random_state=None,
         shrinkage=None,
+        n_jobs=None,
     ):
         super().__init__(sampling_strategy=sampling_strategy)
         self.random_state = random_state
         self.shrinkage = shrinkage
+        self.n_jobs = n_jobs
 
     def _check_X_y(self, X, y):
         y, binarize_y = check_target_type(y, indicate_one_vs_all=True)
@@ -148,7 +458,7 @@ RandomOverSampler # doctest: +NORMALIZE_WHITESPACE
         return X, y, binarize_y
 
     def _fit_resample(self, X, y):
-        random_state = check_random_state(self.random_state)
+        seed_sequence = _get_seed_sequence(self.random_state)
 
         if isinstance(self.shrinkage, Real):
             self.shrinkage_ = {
@@ -192,53 +502,108 @@ RandomOverSampler # doctest: +NORMALIZE_WHITESPACE
                     "sample."
                 ) from exc
 
-        X_resampled = [X.copy()]
-        y_resampled = [y.copy()]
+        n_samples, n_features = X.shape
+        if self.shrinkage_ is not None:
+            # the perturbation is generated in the floating dtype of X to avoid
+            # conversions; other dtypes are perturbed in float64
+            if X.dtype in (np.float32, np.float64):
+                smoothing_dtype = X.dtype
+            else:
+                smoothing_dtype = np.float64
+        n_samples_resampled = n_samples + sum(self.sampling_strategy_.values())
 
-        sample_indices = range(X.shape[0])
-        for class_sample, num_samples in self.sampling_strategy_.items():
-            target_class_indices = np.flatnonzero(y == class_sample)
-            bootstrap_indices = random_state.choice(
-                target_class_indices,
-                size=num_samples,
-                replace=True,
+        if sparse.issparse(X):
+            # rows are gathered from a CSR matrix whatever the input format;
+            # the sparse blocks are stacked once at the end by concatenating
+            # their underlying CSR buffers
+            X_format = X.format
+            X = X.tocsr()
+            X_resampled = [X]
+        else:
+            # the original samples are copied only once, directly in the output
+            X_resampled = np.empty(
+                (n_samples_resampled, n_features),
+                dtype=X.dtype if self.shrinkage_ is None else smoothing_dtype,
             )
-            sample_indices = np.append(sample_indices, bootstrap_indices)
-            if self.shrinkage_ is not None:
-                # generate a smoothed bootstrap with a perturbation
-                n_samples, n_features = X.shape
-                smoothing_constant = (4 / ((n_features + 2) * n_samples)) ** (
-                    1 / (n_features + 4)
-                )
-                if sparse.issparse(X):
-                    _, X_class_variance = mean_variance_axis(
-                        X[target_class_indices, :],
-                        axis=0,
-                    )
-                    X_class_scale = np.sqrt(X_class_variance, out=X_class_variance)
-                else:
-                    X_class_scale = np.std(X[target_class_indices, :], axis=0)
-                smoothing_matrix = np.diagflat(
-                    self.shrinkage_[class_sample] * smoothing_constant * X_class_scale
-                )
-                X_new = random_state.randn(num_samples, n_features)
-                X_new = X_new.dot(smoothing_matrix) + X[bootstrap_indices, :]
-                if sparse.issparse(X):
-                    X_new = sparse.csr_matrix(X_new, dtype=X.dtype)
-                X_resampled.append(X_new)
-            else:
-                # generate a bootstrap
-                X_resampled.append(_safe_indexing(X, bootstrap_indices))
+            np.copyto(X_resampled[:n_samples], X)
+        y_resampled = np.empty(n_samples_resampled, dtype=y.dtype)
+        np.copyto(y_resampled[:n_samples], y)
+
+        self.sample_indices_ = np.empty(n_samples_resampled, dtype=np.intp)
+        self.sample_indices_[:n_samples] = np.arange(n_samples)
+
+        # group the sample indices by class with a single sort of the target
+        # instead of comparing the whole target with each class
+        classes, y_encoded = np.unique(y, return_inverse=True)
+        class_indices = dict(
+            zip(
+                classes,
+                np.split(
+                    np.argsort(y_encoded, kind="stable"),
+                    np.cumsum(np.bincount(y_encoded))[:-1],
+                ),
+            )
+        )
 
-            y_resampled.append(_safe_indexing(y, bootstrap_indices))
+        if self.shrinkage_ is not None:
+            smoothing_constant = (4 / ((n_features + 2) * n_samples)) ** (
+                1 / (n_features + 4)
+            )
+            with _numba_num_threads(self.n_jobs):
+                class_variance = _class_variance(
+                    X,
+                    {klass: class_indices[klass] for klass in self.sampling_strategy_},
+                )
 
-        self.sample_indices_ = np.array(sample_indices)
+        # each class is resampled by an independent generator such that the
+        # results do not depend on the number of jobs
+        class_seeds = seed_sequence.spawn(len(self.sampling_strategy_))
+        jobs, start = [], n_samples
+        for (class_sample, num_samples), seed in zip(
+            self.sampling_strategy_.items(), class_seeds
+        ):
+            stop = start + num_samples
+            target_class_indices = class_indices[class_sample]
+            if self.shrinkage_ is not None:
+                # generate a smoothed bootstrap with a perturbation; scaling by
+                # a diagonal smoothing matrix boils down to a feature-wise
+                # broadcast multiplication by the scaled standard deviation,
+                # computed in place of the variance
+                scale = class_variance[class_sample]
+                np.sqrt(scale, out=scale)
+                scale *= self.shrinkage_[class_sample] * smoothing_constant
+                scale = scale.astype(smoothing_dtype, copy=False)
+            else:
+                scale = None
+            jobs.append(
+                delayed(_generate_bootstrap)(
+                    X,
+                    target_class_indices,
+                    scale,
+                    np.random.default_rng(seed),
+                    None if sparse.issparse(X) else X_resampled[start:stop],
+                    self.sample_indices_[start:stop],
+                )
+            )
+            # all the bootstrapped samples of a class share the same target:
+            # fill the output instead of gathering `y`
+            y_resampled[start:stop] = class_sample
+            start = stop
+
+        # each class is written in a disjoint slice of the preallocated output;
+        # the numba kernel cannot be launched from several threads with the
+        # workqueue threading layer, so the classes are then resampled one
+        # after another by the kernel using `n_jobs` threads
+        if self.shrinkage_ is not None and _use_numba(X):
+            with _numba_num_threads(self.n_jobs):
+                class_blocks = Parallel(n_jobs=1)(jobs)
+        else:
+            class_blocks = Parallel(n_jobs=self.n_jobs, require="sharedmem")(jobs)
 
         if sparse.issparse(X):
-            X_resampled = sparse.vstack(X_resampled, format=X.format)
-        else:
-            X_resampled = np.vstack(X_resampled)
-        y_resampled = np.hstack(y_resampled)
+            for blocks in class_blocks:
+                X_resampled.extend(blocks)
+            X_resampled = _stack_csr(X_resampled, n_features).asformat(X_format)
 
         return X_resampled, y_resampled
 
@@ -3,6 +3,9 @@
 #          Christos Aridas
 # License: MIT
 
+import os
+import subprocess
+import sys
 from collections import Counter
 
 import numpy as np
@@ -13,6 +16,7 @@ from sklearn.utils._testing import assert_array_equal
 from sklearn.utils._testing import _convert_container
 
 from imblearn.over_sampling import RandomOverSampler
+from imblearn.over_sampling import _random_over_sampler
 
 RND_SEED = 0
 
@@ -62,10 +66,10 @@ def test_ros_fit_resample(X_type, data, params):
             [0.12372842, 0.6536186],
             [0.13347175, 0.12167502],
             [0.094035, -2.55298982],
+            [0.13347175, 0.12167502],
+            [0.13347175, 0.12167502],
             [0.92923648, 0.76103773],
-            [0.47104475, 0.44386323],
             [0.92923648, 0.76103773],
-            [0.47104475, 0.44386323],
         ]
     )
     y_gt = np.array([1, 0, 1, 0, 1, 1, 1, 1, 0, 1, 0, 0, 0, 0])
@@ -253,3 +257,261 @@ def test_random_over_sampler_shrinkage_error(data, shrinkage, err_msg):
     ros = RandomOverSampler(shrinkage=shrinkage)
     with pytest.raises(ValueError, match=err_msg):
         ros.fit_resample(X, y)
+
+
+@pytest.mark.parametrize("X_type", ["sparse_csr", "sparse_csc"])
+@pytest.mark.parametrize("params", [{"shrinkage": None}, {"shrinkage": 1}])
+def test_random_over_sampler_sparse_dense_equivalence(data, X_type, params):
+    # check that sparse and dense inputs lead to the same resampling
+    X, y = data
+    ros = RandomOverSampler(**params, random_state=RND_SEED)
+    X_res_dense, y_res_dense = ros.fit_resample(X, y)
+    X_res_sparse, y_res_sparse = ros.fit_resample(_convert_container(X, X_type), y)
+
+    assert X_res_sparse.format == X_type.split("_")[1]
+    assert_allclose(X_res_sparse.toarray(), X_res_dense)
+    assert_array_equal(y_res_sparse, y_res_dense)
+
+
+def test_random_over_sampler_smoothed_bootstrap_numba(data, monkeypatch):
+    # check that the numba kernel and the NumPy implementation generate the
+    # same smoothed bootstrap
+    pytest.importorskip("numba")
+    X, y = data
+    ros = RandomOverSampler(shrinkage=1, random_state=RND_SEED)
+    X_res_numba, y_res_numba = ros.fit_resample(X, y)
+
+    monkeypatch.setattr(_random_over_sampler, "numba", None)
+    X_res_numpy, y_res_numpy = ros.fit_resample(X, y)
+
+    assert_allclose(X_res_numba, X_res_numpy)
+    assert_array_equal(y_res_numba, y_res_numpy)
+
+
+@pytest.mark.parametrize("X_type", ["array", "sparse_csr"])
+def test_random_over_sampler_batch(data, X_type, monkeypatch):
+    # check that the bootstrap generated by batch is consistent with the
+    # selected sample indices
+    monkeypatch.setattr(_random_over_sampler, "_BATCH_SIZE", 3)
+    X, y = data
+    X_ = _convert_container(X, X_type)
+    ros = RandomOverSampler(random_state=RND_SEED)
+    X_res, y_res = ros.fit_resample(X_, y)
+    if X_type == "sparse_csr":
+        X_res = X_res.toarray()
+
+    assert Counter(y_res) == {0: 7, 1: 7}
+    assert_allclose(X_res, X[ros.sample_indices_])
+    assert_array_equal(y_res, y[ros.sample_indices_])
+
+
+@pytest.mark.parametrize("X_type", ["array", "sparse_csr", "sparse_csc"])
+def test_random_over_sampler_no_shared_memory(data, X_type):
+    # check that the resampled dataset does not share memory with the input
+    X, y = data
+    X_ = _convert_container(X, X_type)
+    X_res, y_res = RandomOverSampler(random_state=RND_SEED).fit_resample(X_, y)
+
+    if X_type == "array":
+        assert not np.shares_memory(X_res, X_)
+    else:
+        assert not np.shares_memory(X_res.data, X_.data)
+    assert not np.shares_memory(y_res, y)
+
+
+@pytest.mark.parametrize("offset", [0, 1e8])
+@pytest.mark.parametrize("use_numba", [True, False])
+@pytest.mark.parametrize("X_type", ["array", "sparse_csr"])
+def test_class_variance(data, X_type, use_numba, offset, monkeypatch):
+    # check that the per-class variance is the one of the class samples; a
+    # large offset checks that the variance does not suffer from catastrophic
+    # cancellation
+    if use_numba:
+        pytest.importorskip("numba")
+    else:
+        monkeypatch.setattr(_random_over_sampler, "numba", None)
+    X, y = data
+    X = X + offset
+    y = y.copy()
+    y[[5, 6]] = 2
+    X_ = _convert_container(X, X_type)
+    class_indices = {klass: np.flatnonzero(y == klass) for klass in (2, 0)}
+    class_variance = _random_over_sampler._class_variance(X_, class_indices)
+
+    assert sorted(class_variance) == [0, 2]
+    for klass, variance in class_variance.items():
+        assert_allclose(variance, np.var(X[y == klass], axis=0))
+
+
+def test_class_variance_numba_blocks():
+    # check the variance computed by the numba kernel on several blocks of
+    # features
+    pytest.importorskip("numba")
+    rng = np.random.RandomState(RND_SEED)
+    X = rng.randn(30, 600)
+    y = rng.randint(3, size=30)
+    class_indices = {klass: np.flatnonzero(y == klass) for klass in range(3)}
+    class_variance = _random_over_sampler._class_variance(X, class_indices)
+
+    for klass, variance in class_variance.items():
+        assert_allclose(variance, np.var(X[y == klass], axis=0))
+
+
+@pytest.mark.parametrize("X_type", ["array", "sparse_csr"])
+def test_random_over_sampler_smoothed_bootstrap_blocks(data, X_type, monkeypatch):
+    # check that the NumPy smoothed bootstrap processed by blocks of rows is
+    # not impacted by the block size
+    X, y = data
+    X = _convert_container(X, X_type)
+    monkeypatch.setattr(_random_over_sampler, "numba", None)
+    ros = RandomOverSampler(shrinkage=1, random_state=RND_SEED)
+    X_res, y_res = ros.fit_resample(X, y)
+
+    monkeypatch.setattr(_random_over_sampler, "_BLOCK_N_ELEMENTS", 3)
+    X_res_blocks, y_res_blocks = ros.fit_resample(X, y)
+
+    if X_type == "sparse_csr":
+        X_res, X_res_blocks = X_res.toarray(), X_res_blocks.toarray()
+    assert_allclose(X_res_blocks, X_res)
+    assert_array_equal(y_res_blocks, y_res)
+
+
+@pytest.mark.parametrize("use_numba", [True, False])
+@pytest.mark.parametrize("X_type", ["array", "sparse_csr"])
+@pytest.mark.parametrize("params", [{"shrinkage": None}, {"shrinkage": 1}])
+def test_random_over_sampler_n_jobs(data, X_type, params, use_numba, monkeypatch):
+    # check that the resampling does not depend on the number of jobs
+    if use_numba:
+        pytest.importorskip("numba")
+    else:
+        monkeypatch.setattr(_random_over_sampler, "numba", None)
+    X, y = data
+    y = y.copy()
+    y[[5, 6]] = 2
+    X = _convert_container(X, X_type)
+    ros = RandomOverSampler(**params, random_state=RND_SEED)
+    X_res, y_res = ros.fit_resample(X, y)
+    sample_indices = ros.sample_indices_
+
+    ros.set_params(n_jobs=2)
+    X_res_parallel, y_res_parallel = ros.fit_resample(X, y)
+
+    if X_type == "sparse_csr":
+        X_res, X_res_parallel = X_res.toarray(), X_res_parallel.toarray()
+    assert_allclose(X_res_parallel, X_res)
+    assert_array_equal(y_res_parallel, y_res)
+    assert_array_equal(ros.sample_indices_, sample_indices)
+
+
+@pytest.mark.parametrize("n_jobs", [None, 1, 2])
+def test_random_over_sampler_n_jobs_numba_threads(data, n_jobs, monkeypatch):
+    # check that the numba kernels use `n_jobs` threads and that the number of
+    # threads is restored afterwards
+    numba = pytest.importorskip("numba")
+    if numba.config.NUMBA_NUM_THREADS < 2:
+        pytest.skip("numba needs at least 2 threads")
+    num_threads = numba.get_num_threads()
+    kernel_num_threads = []
+
+    def smoothed_bootstrap_numba(*args):
+        kernel_num_threads.append(numba.get_num_threads())
+        return smoothed_bootstrap_numba_orig(*args)
+
+    smoothed_bootstrap_numba_orig = _random_over_sampler._smoothed_bootstrap_numba
+    monkeypatch.setattr(
+        _random_over_sampler, "_smoothed_bootstrap_numba", smoothed_bootstrap_numba
+    )
+    X, y = data
+    ros = RandomOverSampler(shrinkage=1, n_jobs=n_jobs, random_state=RND_SEED)
+    ros.fit_resample(X, y)
+
+    assert kernel_num_threads == [1 if n_jobs is None else n_jobs]
+    assert numba.get_num_threads() == num_threads
+
+
+def test_random_over_sampler_n_jobs_numba_workqueue():
+    # check that the numba kernel is not launched concurrently from several
+    # threads: the workqueue threading layer aborts the interpreter otherwise
+    pytest.importorskip("numba")
+    code = """if True:
+        import numpy as np
+        from imblearn.over_sampling import RandomOverSampler
+        rng = np.random.default_rng(0)
+        X = rng.standard_normal((20_000, 50))
+        y = np.repeat([0, 1, 2, 3], [14_000, 2_000, 2_000, 2_000])
+        ros = RandomOverSampler(shrinkage=1, n_jobs=4, random_state=0)
+        for _ in range(5):
+            ros.fit_resample(X, y)
+    """
+    env = {**os.environ, "NUMBA_THREADING_LAYER": "workqueue"}
+    result = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True
+    )
+
+    assert result.returncode == 0, result.stderr
+
+
+@pytest.mark.parametrize(
+    "dtype, expected_dtype",
+    [(np.float32, np.float32), (np.float64, np.float64), (np.int64, np.float64)],
+)
+def test_random_over_sampler_smoothed_bootstrap_dtype(data, dtype, expected_dtype):
+    # check that the smoothed bootstrap preserves floating dtypes
+    X, y = data
+    X = (X * 10).astype(dtype)
+    X_res, _ = RandomOverSampler(shrinkage=1, random_state=RND_SEED).fit_resample(X, y)
+
+    assert X_res.dtype == expected_dtype
+
+
+@pytest.mark.parametrize("dtype", [np.float16, np.longdouble, np.dtype(">f8")])
+def test_smoothed_bootstrap_numba_unsupported_dtype(data, dtype):
+    # check that the dtypes not supported by numba fall back to the NumPy
+    # implementation
+    X, _ = data
+    X = X.astype(dtype)
+    bootstrap_indices = np.array([0, 3, 3, 9])
+    scale = np.array([0.5, 2.0])
+    noise = np.random.default_rng(RND_SEED).standard_normal((4, 2))
+    X_new = noise.copy()
+    _random_over_sampler._smoothed_bootstrap(X_new, X, bootstrap_indices, scale)
+
+    assert_allclose(X_new, noise * scale + X[bootstrap_indices].astype(np.float64))
+
+
+@pytest.mark.parametrize("X_type", ["sparse_csr", "sparse_csc"])
+def test_random_over_sampler_smoothed_bootstrap_sparsity(X_type):
+    # check that the features which are not perturbed keep the sparsity of the
+    # drawn samples
+    rng = np.random.RandomState(RND_SEED)
+    X = np.zeros((50, 1000))
+    X[:, :3] = rng.randn(50, 3)
+    y = np.array([0] * 10 + [1] * 40)
+    X = _convert_container(X, X_type)
+    ros = RandomOverSampler(shrinkage=0, random_state=RND_SEED)
+    X_res, _ = ros.fit_resample(X, y)
+
+    assert X_res.nnz == 3 * X_res.shape[0]
+    assert_allclose(X_res.toarray(), X.toarray()[ros.sample_indices_])
+
+    ros.set_params(shrinkage=1)
+    X_res, _ = ros.fit_resample(X, y)
+
+    assert X_res.nnz == 3 * X_res.shape[0]
+
+
+@pytest.mark.parametrize("dtype", [np.float16, np.longdouble, np.dtype(">f8")])
+def test_random_over_sampler_numba_unsupported_dtype(data, dtype, monkeypatch):
+    # check that the dtypes not supported by numba are resampled as with the
+    # NumPy implementation
+    X, y = data
+    X = X.astype(dtype)
+    ros = RandomOverSampler(shrinkage=1, random_state=RND_SEED)
+    X_res, y_res = ros.fit_resample(X, y)
+
+    monkeypatch.setattr(_random_over_sampler, "numba", None)
+    X_res_numpy, y_res_numpy = ros.fit_resample(X, y)
+
+    assert X_res.dtype == np.float64
+    assert_allclose(X_res, X_res_numpy)
+    assert_array_equal(y_res, y_res_numpy)
@@ -31,6 +31,7 @@ def _get_deps_info():
         "keras",
         "tensorflow",
         "joblib",
+        "numba",
     ]
 
     def get_version(module):
@@ -36,6 +36,7 @@ def test_show_versions_default(capsys):
     assert "keras" in out
     assert "tensorflow" in out
     assert "joblib" in out
+    assert "numba" in out
 
 
 def test_show_versions_github(capsys):
@@ -58,4 +59,5 @@ def test_show_versions_github(capsys):
     assert "* keras" in out
     assert "* tensorflow" in out
     assert "* joblib" in out
+    assert "* numba" in out
     assert "</details>" in out
@@ -39,7 +39,7 @@ CLASSIFIERS = [
     "Programming Language :: Python :: 3.9",
 ]
 INSTALL_REQUIRES = [
-    "numpy>=1.13.3",
+    "numpy>=1.17.3",
     "scipy>=0.19.1",
     "scikit-learn>=0.24",
     "joblib>=0.11",